@@ -1,5 +1,5 @@
 """Main Flask application."""
-from flask import Flask, render_template_string, redirect, url_for
+from flask import Flask, render_template_string, redirect, url_for, request, jsonify
 from flask_cors import CORS
 from flask_login import LoginManager, current_user
 import logging
@@ -130,6 +130,27 @@ def update_database_schema():
                             logger.info("✓ Successfully created index on previous_response_id")
                         except sqlite3.Error as idx_error:
                             logger.warning(f"Could not create index (may already exist): {idx_error}")
+                
+                # Add composite indexes to data_items tables created before they were declared
+                cursor.execute("""
+                    SELECT name FROM sqlite_master 
+                    WHERE type='table' AND name='data_items'
+                """)
+                if cursor.fetchone():
+                    cursor.execute("""
+                        CREATE INDEX IF NOT EXISTS ix_data_items_user_plugin_type 
+                        ON data_items(user_id, plugin_name, item_type)
+                    """)
+                    conn.commit()
+                    try:
+                        cursor.execute("""
+                            CREATE UNIQUE INDEX IF NOT EXISTS uq_data_items_user_plugin_source 
+                            ON data_items(user_id, plugin_name, source_id)
+                        """)
+                        conn.commit()
+                    except sqlite3.IntegrityError as idx_error:
+                        # Older imports may have stored duplicates; leave the table as is rather than deleting data
+                        logger.warning(f"Could not create unique index on data_items (duplicate items exist): {idx_error}")
                             
             except sqlite3.Error as e:
                 logger.warning(f"Database schema update check failed: {e}")
@@ -163,12 +184,10 @@ app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 24 hours
 @login_manager.unauthorized_handler
 def unauthorized():
     """Handle unauthorized access - return JSON for API requests, redirect for HTML."""
-    from flask import request, jsonify
     # If it's an API request, return JSON error instead of redirect
     if request.path.startswith('/api/'):
         return jsonify({"error": "Authentication required", "authenticated": False}), 401
     # For non-API requests, redirect to login (default behavior)
-    from flask_login import current_user
     if not current_user.is_authenticated:
         return redirect(url_for('login_page'))
     return jsonify({"error": "Access denied"}), 403
@@ -186,7 +205,7 @@ def load_user(user_id):
         # Use Session.get() instead of Query.get() for SQLAlchemy 2.0 compatibility
         user = db.get(User, int(user_id))
         if user:
-            logger.debug(f"Loaded user: {user.email} (ID: {user.id})")
+            logger.debug("Loaded user: %s (ID: %s)", user.email, user.id)
         return user
     except Exception as e:
         logger.error(f"Error loading user {user_id}: {e}", exc_info=True)
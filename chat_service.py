@@ -1,11 +1,22 @@
 """Service for managing Gemini 3 conversations with File Search Tool (RAG)."""
-import os
+import re
 import logging
-from typing import Optional, List, Dict, Any
-from google import genai
+import functools
+import hashlib
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Tuple, Callable, Generator, Iterator
 from google.genai import types
+from google.genai import errors as genai_errors
+from sqlalchemy import bindparam, select, text
 from database import UserSettings, ChatThread, SessionLocal
-from file_search_service import FileSearchService
+from file_search_service import FileSearchService, get_store_generation
+from utils.cache import TTLCache
+from utils.rate_limit import TokenBucket
+from utils.genai_client import get_genai_client
 import config
 
 logger = logging.getLogger(__name__)
@@ -22,53 +33,537 @@ Instructions:
 - If no relevant information is found after searching, you can use your general knowledge
 - Be thorough and analytical when answering questions about the user's data"""
 
+# Keywords suggesting a question about the user's imported data (matched anywhere, case-insensitive)
+DATA_QUESTION_KEYWORDS = ("my", "me", "my emails", "my messages", "my data", "tell me about", "what can you", "analyze", "insights", "summary")
+_DATA_QUESTION_RE = re.compile("|".join(map(re.escape, DATA_QUESTION_KEYWORDS)), re.IGNORECASE)
+
+# Phrases suggesting the model answered without finding the user's data (diagnostic only)
+_NOT_FOUND_RE = re.compile(r"cannot find|no data|no emails", re.IGNORECASE)
+
+INSTRUCTIONS_ACK = "I understand. I'll use the File Search Tool to find relevant information from your imported data to answer questions accurately."
+
+
+@functools.lru_cache(maxsize=256)
+def _instruction_preamble(instructions: str) -> tuple:
+    """Build (and cache) the instruction/acknowledgement turns that open every conversation.
+
+    Gemini has no separate system role, so instructions are sent as a leading user turn
+    followed by a model acknowledgement. Instructions rarely change per user, so the same
+    dict objects are reused across calls and the request prefix stays byte-identical,
+    which keeps Gemini's implicit prompt caching effective.
+    """
+    return (
+        {"role": "user", "parts": [{"text": instructions}]},
+        {"role": "model", "parts": [{"text": INSTRUCTIONS_ACK}]},
+    )
+
+
+# Model name prefixes this service can chat with (only Gemini models are supported)
+SUPPORTED_MODEL_PREFIXES = ("gemini-",)
+
+
+@functools.lru_cache(maxsize=1024)
+def _is_supported_model(model: str) -> bool:
+    """Check (once per model name) whether a stored model preference can be used for chat."""
+    return model.startswith(SUPPORTED_MODEL_PREFIXES)
+
+
+@functools.lru_cache(maxsize=512)
+def _generation_config(file_search_store_name: Optional[str]) -> types.GenerateContentConfig:
+    """Build (and cache) the generation config, adding the File Search Tool when a store is given."""
+    tools = None
+    if file_search_store_name:
+        tools = [
+            types.Tool(
+                file_search=types.FileSearch(
+                    file_search_store_names=[file_search_store_name]
+                )
+            )
+        ]
+    return types.GenerateContentConfig(
+        temperature=1.0,  # Gemini 3 default
+        tools=tools
+    )
+
+
+def _extract_text_attribute(response: Any) -> str:
+    """Extract text from a response exposing a 'text' attribute."""
+    return response.text
+
+
+def _extract_candidate_text(response: Any) -> str:
+    """Extract text by joining the text parts of the first candidate."""
+    if response.candidates:
+        content = response.candidates[0].content
+        if content and content.parts:
+            text_parts = [part.text for part in content.parts if part.text]
+            if text_parts:
+                return "\n".join(text_parts)
+    return str(response)
+
+
+# Text extractor per response type, probed once per process rather than once per ChatService instance
+_extractor_cache: Dict[type, Callable[[Any], str]] = {}
+
+
+# Process-wide request and token budgets for Gemini calls (disabled when the limit is 0)
+_request_bucket = TokenBucket(config.GEMINI_RPM)
+_token_bucket = TokenBucket(config.GEMINI_TPM)
+
+
+def _estimate_tokens(contents: List[Dict[str, Any]]) -> int:
+    """Roughly estimate prompt tokens for rate limiting (~4 characters per token)."""
+    chars = sum(len(part.get("text", "")) for content in contents for part in content["parts"])
+    return chars // 4 + 1
+
+
+# Transient Gemini API failures worth retrying (rate limiting and server-side errors)
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+RETRY_BASE_DELAY = 1.0  # seconds
+RETRY_MAX_DELAY = 20.0  # seconds
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Return the server-advised Retry-After delay from an API error, if present."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return min(RETRY_MAX_DELAY, float(headers.get('retry-after')))
+    except (TypeError, ValueError):
+        return None
+
+
+def _model_plan(model: str) -> Tuple[str, ...]:
+    """Models to try for a request: the selected one, then the default if the selected one is gone."""
+    return (model,) if model == config.DEFAULT_MODEL else (model, config.DEFAULT_MODEL)
+
+
+def _retry_delay(error: genai_errors.APIError, attempt_model: str, model_plan: Tuple[str, ...], attempt: int) -> Optional[float]:
+    """Decide how to continue after a failed Gemini call.
+    
+    Returns None to move on to the next model in the plan (the selected model was retired, 404),
+    or the number of seconds to wait before retrying a rate-limit/server error.
+    Re-raises the error when it is not worth retrying.
+    """
+    if error.code == 404 and isinstance(error, genai_errors.ClientError) and attempt_model != model_plan[-1]:
+        logger.warning("Model %s is not available (%s), falling back to %s", attempt_model, error, config.DEFAULT_MODEL)
+        return None
+    max_retries = config.CHAT_MAX_RETRIES
+    if error.code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+        raise error
+    delay = _retry_after_seconds(error)
+    if delay is None:
+        # Full jitter: random delay up to the exponential backoff ceiling
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    logger.warning("Gemini request failed with status %s (attempt %d/%d), retrying in %.1fs",
+                   error.code, attempt + 1, max_retries + 1, delay)
+    return delay
+
+
+def _log_if_data_not_found(response_text: str, file_search_store_name: Optional[str]) -> None:
+    """Log if File Search Tool was available but the response suggests it wasn't used."""
+    if file_search_store_name and _NOT_FOUND_RE.search(response_text):
+        logger.warning("File Search Tool was available but response suggests data wasn't found. Store: %s", file_search_store_name)
+        logger.warning("Consider checking if files are indexed in the File Search Store")
+
+
+# Gemini Batch API job states after which a job will not change again
+BATCH_TERMINAL_STATES = frozenset({"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"})
+BATCH_POLL_INITIAL_INTERVAL = 10.0  # seconds
+BATCH_POLL_MAX_INTERVAL = 120.0  # seconds
+
+
+# Runs the diagnostic File Search Store file-count check without holding up chat requests
+_store_check_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-check")
+
+
+# Caps concurrent generate_content calls across all chat requests in this process
+_generation_slots = threading.BoundedSemaphore(config.CHAT_MAX_CONCURRENT)
+
+
+# First-turn response cache keyed by a digest of everything that shapes the answer
+_response_cache = TTLCache(maxsize=config.CHAT_RESPONSE_CACHE_SIZE, ttl=config.CHAT_RESPONSE_CACHE_TTL)
+
+
+def _response_cache_key(
+    user_id: int,
+    model: str,
+    instructions: str,
+    file_search_store_name: Optional[str],
+    message: str
+) -> str:
+    """Build the response cache key for a first-turn message.
+    
+    The store's upload generation is part of the key, so importing new data stops
+    serving answers cached before the import.
+    """
+    generation = get_store_generation(file_search_store_name)
+    raw = f"{user_id}|{model}|{instructions}|{file_search_store_name}|{generation}|{message}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _lookup_first_turn(
+    user_id: int,
+    model: str,
+    instructions: str,
+    file_search_store_name: Optional[str],
+    message: str,
+    conversation_history: List[Dict[str, str]]
+) -> Tuple[Optional[str], Optional[str]]:
+    """Look a message up in the response cache.
+    
+    Only first turns carry no history, so only they are cached. Returns (cache key, cached answer):
+    the key is None for later turns and the answer is None on a miss.
+    """
+    if conversation_history:
+        return None, None
+    cache_key = _response_cache_key(user_id, model, instructions, file_search_store_name, message)
+    response_text = _response_cache.get(cache_key)
+    if response_text is not None:
+        logger.info("Serving cached response for user %s (model: %s)", user_id, model)
+    return cache_key, response_text
+
+
+def _cache_response(cache_key: Optional[str], response_text: str) -> None:
+    """Cache a first-turn answer; empty (e.g. blocked) answers are not worth replaying."""
+    if cache_key is not None and response_text:
+        _response_cache.set(cache_key, response_text)
+
+
+# Single-flight registry: concurrent identical first-turn requests share one Gemini call
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _single_flight(key: str, compute: Callable[[], str]) -> str:
+    """Run compute() once per key at a time; concurrent callers with the same key wait for its result."""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = _inflight[key] = Future()
+    if not is_leader:
+        return future.result()
+    
+    try:
+        result = compute()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+_GEMINI_ROLES = {"user": "user", "assistant": "model"}
+
+
+def _history_message_content(msg: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Convert a stored history message to Gemini content (None for unsupported roles)."""
+    role = _GEMINI_ROLES.get(msg.get("role"))
+    if role is None:
+        return None
+    return {"role": role, "parts": [{"text": msg.get("content", "")}]}
+
+
+# Per-user (instructions, model) cache so chat turns don't hit user_settings every time
+# Entries are dropped via invalidate_user_settings() whenever a user's settings change; the TTL
+# bounds staleness for changes made by other worker processes
+_settings_cache = TTLCache(maxsize=4096, ttl=config.SETTINGS_CACHE_TTL)
+
+
+# user_id is a unique column rather than the primary key, so Session.get() can't be used;
+# building the statement once keeps its compiled form in SQLAlchemy's cache across calls
+_USER_SETTINGS_STMT = select(
+    UserSettings.assistant_instructions,
+    UserSettings.assistant_model
+).where(UserSettings.user_id == bindparam("user_id"))
+
+
+def invalidate_user_settings(user_id: int) -> None:
+    """Drop cached chat settings for a user (call after updating their UserSettings)."""
+    _settings_cache.pop(user_id)
+
+
+def clear_user_settings_cache() -> None:
+    """Drop all cached chat settings (e.g. after the database is recreated)."""
+    _settings_cache.clear()
+
 
 class ChatService:
     """Service for managing Gemini 3 conversations with context retrieval."""
     
     def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable is required")
-        self.client = genai.Client(api_key=api_key)
-        self.file_search_service = FileSearchService()
+        self.client = get_genai_client()
+        self.file_search_service = FileSearchService(client=self.client)
+        # Resolve the SDK call path once instead of walking client.models on every message
+        self._generate_content = self.client.models.generate_content
+        self._generate_content_stream = self.client.models.generate_content_stream
+        self._warm_database()
+        # Build the shared request pieces up front so the first chat turn doesn't construct them
+        _generation_config(None)
+        _instruction_preamble(DEFAULT_INSTRUCTIONS)
+    
+    def _warm_database(self) -> None:
+        """Open a pooled database connection up front so the first chat turn doesn't pay for it."""
+        try:
+            with SessionLocal() as db:
+                db.execute(text("SELECT 1"))
+        except Exception as e:
+            logger.warning("Could not warm database connection: %s", e)
     
     def _get_instructions(self, user_id: int = None) -> str:
         """Get chat instructions for a user (custom or default)."""
-        if user_id is None:
-            return DEFAULT_INSTRUCTIONS
-        
-        db = SessionLocal()
-        try:
-            settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
-            if settings and settings.assistant_instructions:
-                return settings.assistant_instructions
-            return DEFAULT_INSTRUCTIONS
-        finally:
-            db.close()
+        return self._get_user_settings(user_id)[0]
     
     def _get_model(self, user_id: int = None) -> str:
         """Get chat model for a user (custom or default)."""
+        return self._get_user_settings(user_id)[1]
+    
+    def _load_user_settings(self, user_id: int) -> Tuple[str, str]:
+        """Load (instructions, model) for a user from the database in a single query."""
+        instructions = DEFAULT_INSTRUCTIONS
+        model = config.DEFAULT_MODEL
+        
+        with SessionLocal() as db:
+            row = db.execute(_USER_SETTINGS_STMT, {"user_id": user_id}).first()
+        
+        if row:
+            if row.assistant_instructions:
+                instructions = row.assistant_instructions
+            # Validated once per cache fill: the model must still be offered (same rule as the settings page)
+            if row.assistant_model and row.assistant_model in config.AVAILABLE_MODELS_SET and _is_supported_model(row.assistant_model):
+                logger.debug("Using user-selected model: %s for user %s", row.assistant_model, user_id)
+                model = row.assistant_model
+        return instructions, model
+    
+    def _get_user_settings(self, user_id: int = None) -> Tuple[str, str]:
+        """Get (instructions, model) for a user, served from the settings cache when possible."""
         if user_id is None:
-            return "gemini-3-pro-preview"
+            return DEFAULT_INSTRUCTIONS, config.DEFAULT_MODEL
         
-        db = SessionLocal()
-        try:
-            settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
-            if settings and settings.assistant_model:
-                # Check if it's a Gemini model
-                if settings.assistant_model.startswith("gemini-"):
-                    logger.debug(f"Using user-selected model: {settings.assistant_model} for user {user_id}")
-                    return settings.assistant_model
-            return "gemini-3-pro-preview"
-        finally:
-            db.close()
+        settings = _settings_cache.get(user_id)
+        if settings is None:
+            settings = self._load_user_settings(user_id)
+            _settings_cache.set(user_id, settings)
+        return settings
     
     def _get_thinking_level(self, user_id: int = None) -> str:
         """Get thinking level for Gemini 3 (low or high)."""
         # Default to high for better reasoning, can be made configurable later
         return "high"
     
+    def _get_file_search_store_name(self, user_id: int) -> Optional[str]:
+        """Get the user's File Search Store name, warning (in the background) if the store looks empty."""
+        file_search_store_name = self.file_search_service.get_unified_file_search_store_name(user_id=user_id)
+        
+        # Check if store has files (for debugging). The check is an extra API round-trip, so it
+        # runs off the request path instead of delaying the chat call
+        if file_search_store_name:
+            _store_check_executor.submit(self._check_store_has_files, user_id, file_search_store_name)
+        
+        return file_search_store_name
+    
+    def _check_store_has_files(self, user_id: int, file_search_store_name: str) -> None:
+        """Log a warning if the user's File Search Store has no files (diagnostic only)."""
+        # Counts barely change between turns, so a recent answer is good enough here
+        store_info = self.file_search_service.get_file_search_store_info(user_id=user_id, use_cache=True)
+        if store_info:
+            file_count = store_info['file_count']
+            pending_count = store_info['pending_count']
+            failed_count = store_info['failed_count']
+            if failed_count:
+                logger.warning("File Search Store has %s failed files. Store: %s", failed_count, file_search_store_name)
+            if file_count == 0 and pending_count:
+                logger.warning(
+                    "File Search Store has 0 searchable files yet (%s still processing). Store: %s",
+                    pending_count, file_search_store_name
+                )
+            elif file_count == 0:
+                logger.warning("File Search Store exists but has 0 files! Store: %s", file_search_store_name)
+                logger.warning("This means no data has been uploaded to the File Search Store yet.")
+                logger.warning("Please use the 'Re-upload All Data to File Search Store' button to upload your data.")
+            else:
+                logger.debug(
+                    "File Search Store has %s files available for search (%s pending)", file_count, pending_count
+                )
+    
+    def _build_contents(
+        self,
+        instructions: str,
+        conversation_history: List[Dict[str, str]],
+        message: str,
+        file_search_store_name: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """Build the Gemini contents list (instructions, history, then the new message)."""
+        # System instructions go first as a cached user/model preamble (Gemini doesn't have separate system messages)
+        contents = list(_instruction_preamble(instructions)) if instructions else []
+        
+        # Add conversation history, keeping only the most recent messages so prompts don't grow without bound
+        # (only the window is converted, so long threads cost no more per turn than short ones)
+        max_messages = config.CHAT_HISTORY_MAX_MESSAGES
+        truncated = bool(max_messages) and len(conversation_history) > max_messages
+        window = conversation_history[-max_messages:] if truncated else conversation_history
+        history = [content for content in map(_history_message_content, window) if content is not None]
+        # Start a truncated window on a user turn so it doesn't open with an orphaned model reply
+        if truncated and history and history[0]["role"] == "model":
+            history = history[1:]
+        contents.extend(history)
+        
+        # Add current user message
+        # If File Search Tool is available, explicitly prompt to use it for data-related questions
+        user_message = message
+        if file_search_store_name:
+            # Check if the message seems to be asking about user's data
+            if _DATA_QUESTION_RE.search(message):
+                # Add explicit instruction to use File Search Tool
+                user_message = f"{message}\n\n[Use the File Search Tool to search through all imported data to answer this question comprehensively.]"
+                logger.debug("Added explicit File Search Tool prompt for data-related question")
+        
+        contents.append({
+            "role": "user",
+            "parts": [{"text": user_message}]
+        })
+        return contents
+    
+    def _respond(
+        self,
+        user_id: int,
+        model: str,
+        instructions: str,
+        conversation_history: List[Dict[str, str]],
+        message: str,
+        file_search_store_name: Optional[str]
+    ) -> str:
+        """Get the response text for a message, serving first turns from the response cache when possible."""
+        # Generate response with File Search Tool
+        try:
+            # Generation config (with File Search Tool if store exists) is built once per store
+            if file_search_store_name:
+                logger.debug("Using File Search Tool with store: %s", file_search_store_name)
+                # Log that we're expecting the tool to be used
+                if logger.isEnabledFor(logging.DEBUG):
+                    message_lower = message.lower()
+                    if "my" in message_lower or "tell me" in message_lower or "what can you" in message_lower:
+                        logger.debug("Question appears to be about user data - File Search Tool should be invoked")
+            
+            # A repeated first-turn question can be served from the response cache
+            cache_key, response_text = _lookup_first_turn(
+                user_id, model, instructions, file_search_store_name, message, conversation_history
+            )
+            if response_text is not None:
+                return response_text
+            
+            def generate() -> str:
+                contents = self._build_contents(instructions, conversation_history, message, file_search_store_name)
+                response_text = self._generate_response_text(model, contents, file_search_store_name)
+                _cache_response(cache_key, response_text)
+                return response_text
+            
+            if cache_key is None:
+                return generate()
+            # Identical first turns arriving together (e.g. a double submit) wait for one call
+            return _single_flight(cache_key, generate)
+            
+        except Exception as e:
+            logger.error("Error generating response with Gemini 3: %s", e, exc_info=True)
+            raise Exception(f"Failed to generate response: {str(e)}")
+    
+    def _get_text_extractor(self, response: Any) -> Callable[[Any], str]:
+        """Get the text extractor for this response type, probing and caching it on first use."""
+        response_type = type(response)
+        extractor = _extractor_cache.get(response_type)
+        if extractor is None:
+            # Probe the class first so the 'text' property isn't evaluated just to test for it
+            if hasattr(response_type, 'text') or hasattr(response, 'text'):
+                extractor = _extract_text_attribute
+            elif hasattr(response, 'candidates'):
+                extractor = _extract_candidate_text
+            else:
+                extractor = str
+            _extractor_cache[response_type] = extractor
+        return extractor
+    
+    def _call_with_retry(self, model: str, contents: List[Dict[str, Any]], request: Callable[[str], Any]) -> Any:
+        """Run request(model) under the client-side rate limits, retrying rate-limit and server errors
+        with jittered exponential backoff and falling back to the default model if the selected one
+        has been retired (404), rather than failing the turn.
+        """
+        estimated_tokens = _estimate_tokens(contents) if _token_bucket.enabled else 0
+        model_plan = _model_plan(model)
+        for attempt_model in model_plan:
+            for attempt in range(config.CHAT_MAX_RETRIES + 1):
+                # Pace requests client-side so bursts wait here instead of failing with 429s
+                _request_bucket.acquire(1)
+                _token_bucket.acquire(estimated_tokens)
+                try:
+                    return request(attempt_model)
+                except genai_errors.APIError as e:
+                    delay = _retry_delay(e, attempt_model, model_plan, attempt)
+                if delay is None:
+                    break
+                time.sleep(delay)
+    
+    def _generate_response_text(
+        self,
+        model: str,
+        contents: List[Dict[str, Any]],
+        file_search_store_name: Optional[str]
+    ) -> str:
+        """Call Gemini and extract the response text."""
+        # Generate content using the new SDK with File Search Tool
+        generation_config = _generation_config(file_search_store_name)
+        
+        def request(attempt_model: str) -> Any:
+            with _generation_slots:
+                return self._generate_content(model=attempt_model, contents=contents, config=generation_config)
+        
+        response = self._call_with_retry(model, contents, request)
+        
+        # Check if File Search Tool was used (diagnostic only, skipped unless debug logging is on).
+        # File search results come back as grounding metadata on the candidate.
+        if file_search_store_name and logger.isEnabledFor(logging.DEBUG) and response.candidates:
+            grounding_metadata = response.candidates[0].grounding_metadata
+            if grounding_metadata and grounding_metadata.grounding_chunks:
+                logger.debug("File Search Tool returned %d grounding chunks", len(grounding_metadata.grounding_chunks))
+            else:
+                logger.debug("File Search Tool was available but returned no grounding chunks")
+        
+        # Extract response text (extraction strategy is resolved once per response type)
+        response_text = self._get_text_extractor(response)(response)
+        _log_if_data_not_found(response_text, file_search_store_name)
+        return response_text
+    
+    def _open_stream(
+        self,
+        model: str,
+        contents: List[Dict[str, Any]],
+        file_search_store_name: Optional[str]
+    ) -> Tuple[Iterator[Any], Optional[Any]]:
+        """Start a streamed generation and wait for its first chunk, with the same retry and fallback as send_message.
+        
+        API errors surface before the first chunk, so retrying until then never resends text.
+        Returns (stream, first chunk or None); the caller holds a generation slot until it
+        releases _generation_slots after consuming the stream.
+        """
+        generation_config = _generation_config(file_search_store_name)
+        
+        def request(attempt_model: str) -> Tuple[Iterator[Any], Optional[Any]]:
+            _generation_slots.acquire()
+            try:
+                stream = iter(self._generate_content_stream(model=attempt_model, contents=contents, config=generation_config))
+                return stream, next(stream, None)
+            except BaseException:
+                _generation_slots.release()
+                raise
+        
+        return self._call_with_retry(model, contents, request)
+    
     def send_message(
         self, 
         message: str, 
@@ -97,168 +592,221 @@ class ChatService:
         if not user_id:
             raise ValueError("user_id is required")
         
-        model = self._get_model(user_id)
-        instructions = self._get_instructions(user_id)
-        thinking_level = self._get_thinking_level(user_id)
+        instructions, model = self._get_user_settings(user_id)
         
         # Get conversation history from database if thread exists and not provided
         if conversation_history is None:
-            conversation_history = []
-            if thread_id:
-                db = SessionLocal()
-                try:
-                    chat_thread = db.query(ChatThread).filter(
-                        ChatThread.openai_thread_id == thread_id,  # Reusing field name for compatibility
-                        ChatThread.user_id == user_id
-                    ).first()
-                    if chat_thread and chat_thread.conversation_history:
-                        conversation_history = chat_thread.conversation_history
-                finally:
-                    db.close()
-        
-        # Get file search store name for this user
-        file_search_store_name = self.file_search_service.get_unified_file_search_store_name(user_id=user_id)
+            conversation_history = self._load_conversation_history(thread_id, user_id)
         
-        # Check if store has files (for debugging)
-        if file_search_store_name:
-            store_info = self.file_search_service.get_file_search_store_info(user_id=user_id)
-            if store_info:
-                file_count = store_info.get('file_count', 'unknown')
-                if file_count == 'unknown':
-                    logger.warning(f"File Search Store exists but file count is unavailable. Store: {file_search_store_name}")
-                    logger.warning("Cannot verify if files are in the store. If search doesn't work, try re-uploading data.")
-                elif file_count == 0:
-                    logger.warning(f"File Search Store exists but has 0 files! Store: {file_search_store_name}")
-                    logger.warning("This means no data has been uploaded to the File Search Store yet.")
-                    logger.warning("Please use the 'Re-upload All Data to File Search Store' button to upload your data.")
-                else:
-                    logger.info(f"File Search Store has {file_count} files available for search")
-        
-        # Build conversation contents for Gemini
-        contents = []
-        
-        # Add system instructions as first user message (Gemini doesn't have separate system messages)
-        if instructions:
-            contents.append({
-                "role": "user",
-                "parts": [{"text": instructions}]
-            })
-            contents.append({
-                "role": "model",
-                "parts": [{"text": "I understand. I'll use the File Search Tool to find relevant information from your imported data to answer questions accurately."}]
-            })
-        
-        # Add conversation history
-        for msg in conversation_history:
-            if msg.get("role") == "user":
-                contents.append({
-                    "role": "user",
-                    "parts": [{"text": msg.get("content", "")}]
-                })
-            elif msg.get("role") == "assistant":
-                contents.append({
-                    "role": "model",
-                    "parts": [{"text": msg.get("content", "")}]
-                })
+        file_search_store_name = self._get_file_search_store_name(user_id)
+        response_text = self._respond(
+            user_id, model, instructions, conversation_history, message, file_search_store_name
+        )
         
-        # Add current user message
-        # If File Search Tool is available, explicitly prompt to use it for data-related questions
-        user_message = message
-        if file_search_store_name:
-            # Check if the message seems to be asking about user's data
-            data_keywords = ["my", "me", "my emails", "my messages", "my data", "tell me about", "what can you", "analyze", "insights", "summary"]
-            message_lower = message.lower()
-            if any(keyword in message_lower for keyword in data_keywords):
-                # Add explicit instruction to use File Search Tool
-                user_message = f"{message}\n\n[Use the File Search Tool to search through all imported data to answer this question comprehensively.]"
-                logger.info(f"Added explicit File Search Tool prompt for data-related question")
+        logger.info("Successfully sent message using Gemini 3 (model: %s, thread: %s)", model, thread_id)
+        return self._build_result(thread_id, conversation_history, message, response_text)
+    
+    def send_message_stream(
+        self,
+        message: str,
+        thread_id: Optional[str] = None,
+        user_id: int = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> Generator[str, None, Dict[str, Any]]:
+        """
+        Send a message using Gemini 3, yielding response text chunks as they are generated.
         
-        contents.append({
-            "role": "user",
-            "parts": [{"text": user_message}]
-        })
+        Takes the same arguments as send_message. The generator's return value (the value of
+        ``yield from``) is the same dictionary send_message returns.
+        """
+        if not user_id:
+            raise ValueError("user_id is required")
         
-        # Generate response with File Search Tool
+        instructions, model = self._get_user_settings(user_id)
+        if conversation_history is None:
+            conversation_history = self._load_conversation_history(thread_id, user_id)
+        file_search_store_name = self._get_file_search_store_name(user_id)
+        
+        # First turns can still be answered from the response cache (as a single chunk)
+        cache_key, response_text = _lookup_first_turn(
+            user_id, model, instructions, file_search_store_name, message, conversation_history
+        )
+        if response_text is not None:
+            yield response_text
+            return self._build_result(thread_id, conversation_history, message, response_text)
+        
+        contents = self._build_contents(instructions, conversation_history, message, file_search_store_name)
+        text_parts = []
         try:
-            # Build generation config with File Search Tool if store exists
-            # Add File Search Tool if store exists
-            tools = None
-            if file_search_store_name:
-                tools = [
-                    types.Tool(
-                        file_search=types.FileSearch(
-                            file_search_store_names=[file_search_store_name]
-                        )
-                    )
-                ]
-                logger.info(f"Using File Search Tool with store: {file_search_store_name}")
-                # Log that we're expecting the tool to be used
-                if "my" in message.lower() or "tell me" in message.lower() or "what can you" in message.lower():
-                    logger.info(f"Question appears to be about user data - File Search Tool should be invoked")
-            
-            # Generate content using the new SDK with File Search Tool
-            response = self.client.models.generate_content(
-                model=model,
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    temperature=1.0,  # Gemini 3 default
-                    tools=tools if tools else None
-                )
-            )
-            
-            # Check if File Search Tool was used
-            if file_search_store_name and hasattr(response, 'candidates') and response.candidates:
-                candidate = response.candidates[0]
-                if hasattr(candidate, 'content') and hasattr(candidate.content, 'parts'):
-                    for part in candidate.content.parts:
-                        # Check if this part indicates tool usage
-                        if hasattr(part, 'function_call') or hasattr(part, 'file_search_result'):
-                            logger.info(f"File Search Tool was invoked in the response")
-                        # Check for file search metadata
-                        if hasattr(part, 'metadata') and hasattr(part.metadata, 'file_search_queries'):
-                            logger.info(f"File Search Tool queries: {part.metadata.file_search_queries}")
-            
-            # Extract response text
-            if hasattr(response, 'text'):
-                response_text = response.text
-            elif hasattr(response, 'candidates') and response.candidates:
-                # Fallback: try to get text from candidates
-                candidate = response.candidates[0]
-                if hasattr(candidate, 'content') and hasattr(candidate.content, 'parts'):
-                    # Try to get text from all parts
-                    text_parts = []
-                    for part in candidate.content.parts:
-                        if hasattr(part, 'text') and part.text:
-                            text_parts.append(part.text)
-                    if text_parts:
-                        response_text = "\n".join(text_parts)
-                    else:
-                        response_text = str(response)
-                else:
-                    response_text = str(response)
-            else:
-                response_text = str(response)
-            
-            # Log if File Search Tool was available but response suggests it wasn't used
-            if file_search_store_name and ("cannot find" in response_text.lower() or "no data" in response_text.lower() or "no emails" in response_text.lower()):
-                logger.warning(f"File Search Tool was available but response suggests data wasn't found. Store: {file_search_store_name}")
-                logger.warning(f"Consider checking if files are indexed in the File Search Store")
-            
-            # Update conversation history
-            updated_history = conversation_history + [
-                {"role": "user", "content": message},
-                {"role": "assistant", "content": response_text}
-            ]
-            
-            logger.info(f"Successfully sent message using Gemini 3 (model: {model}, thread: {thread_id})")
-            
+            stream, first_chunk = self._open_stream(model, contents, file_search_store_name)
+            try:
+                chunks = stream if first_chunk is None else itertools.chain((first_chunk,), stream)
+                for chunk in chunks:
+                    text = chunk.text
+                    if text:
+                        text_parts.append(text)
+                        yield text
+            finally:
+                _generation_slots.release()
+        except Exception as e:
+            logger.error("Error streaming response with Gemini 3: %s", e, exc_info=True)
+            raise Exception(f"Failed to generate response: {str(e)}")
+        
+        response_text = "".join(text_parts)
+        _log_if_data_not_found(response_text, file_search_store_name)
+        _cache_response(cache_key, response_text)
+        
+        logger.info("Successfully streamed message using Gemini 3 (model: %s, thread: %s)", model, thread_id)
+        return self._build_result(thread_id, conversation_history, message, response_text)
+    
+    def _load_conversation_history(self, thread_id: Optional[str], user_id: int) -> List[Dict[str, str]]:
+        """Load a thread's stored conversation history (empty if there is no thread yet)."""
+        if not thread_id:
+            return []
+        with SessionLocal() as db:
+            # Select only the history column rather than hydrating the whole thread row
+            conversation_history = db.query(ChatThread.conversation_history).filter(
+                ChatThread.openai_thread_id == thread_id,  # Reusing field name for compatibility
+                ChatThread.user_id == user_id
+            ).limit(1).scalar()
+        return conversation_history or []
+    
+    def _build_result(
+        self,
+        thread_id: Optional[str],
+        conversation_history: List[Dict[str, str]],
+        message: str,
+        response_text: str
+    ) -> Dict[str, Any]:
+        """Build the send_message result dictionary with the updated conversation history."""
+        # Update conversation history (one list display: no temporary pair list to concatenate)
+        updated_history = [
+            *conversation_history,
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": response_text}
+        ]
+        
+        return {
+            "response_id": thread_id or "gemini_thread",
+            "content": response_text,
+            "openai_thread_id": thread_id,  # Store in openai_thread_id field for database compatibility
+            "messages": updated_history
+        }
+    
+    def send_messages_batch(self, messages: List[str], user_id: int = None, max_workers: int = 8) -> List[Dict[str, Any]]:
+        """
+        Send several independent single-turn messages for one user.
+        
+        Settings and the File Search Store are resolved once for the whole batch
+        instead of once per message, and the messages are sent concurrently (still
+        subject to the process-wide concurrency cap and rate limits).
+        
+        Args:
+            messages: User messages, each answered without conversation history
+            user_id: User ID for user-specific settings
+            max_workers: Maximum number of messages in flight at once
+        
+        Returns:
+            List of dictionaries (in input order) with:
+            - content: AI response text
+            - messages: Conversation history for that single exchange
+        """
+        if not user_id:
+            raise ValueError("user_id is required")
+        if not messages:
+            return []
+        
+        instructions, model = self._get_user_settings(user_id)
+        file_search_store_name = self._get_file_search_store_name(user_id)
+        
+        def respond(message: str) -> Dict[str, Any]:
+            response_text = self._respond(user_id, model, instructions, [], message, file_search_store_name)
             return {
-                "response_id": thread_id or "gemini_thread",
                 "content": response_text,
-                "openai_thread_id": thread_id,  # Store in openai_thread_id field for database compatibility
-                "messages": updated_history
+                "messages": [
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": response_text}
+                ]
             }
-            
-        except Exception as e:
-            logger.error(f"Error generating response with Gemini 3: {e}", exc_info=True)
-            raise Exception(f"Failed to generate response: {str(e)}")
+        
+        # Calls are network-bound, so threads overlap the Gemini round-trips; map() keeps input order
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(messages))) as executor:
+            results = list(executor.map(respond, messages))
+        
+        logger.info("Successfully sent batch of %d messages using Gemini 3 (model: %s)", len(messages), model)
+        return results
+    
+    def send_messages_via_batch_api(
+        self,
+        messages: List[str],
+        user_id: int = None,
+        timeout: float = 24 * 3600
+    ) -> List[Dict[str, Any]]:
+        """
+        Answer independent single-turn messages through the Gemini Batch API.
+        
+        For large offline workloads: batch jobs are billed at a discount and use a separate
+        quota from interactive chat, but can take up to 24 hours. Blocks until the job finishes.
+        
+        Args:
+            messages: User messages, each answered without conversation history
+            user_id: User ID for user-specific settings
+            timeout: Seconds to wait for the job before giving up
+        
+        Returns:
+            List of dictionaries (in input order) with:
+            - content: AI response text (None if this request failed)
+            - error: Error details for a failed request (None on success)
+        """
+        if not user_id:
+            raise ValueError("user_id is required")
+        if not messages:
+            return []
+        
+        instructions, model = self._get_user_settings(user_id)
+        file_search_store_name = self._get_file_search_store_name(user_id)
+        generation_config = _generation_config(file_search_store_name)
+        
+        inlined_requests = [
+            {
+                "contents": self._build_contents(instructions, [], message, file_search_store_name),
+                "config": generation_config
+            }
+            for message in messages
+        ]
+        job = self.client.batches.create(
+            model=model,
+            src=inlined_requests,
+            config={"display_name": f"vector_infinity_user_{user_id}_{int(time.time())}"}
+        )
+        logger.info("Submitted Gemini batch job %s with %d messages (model: %s)", job.name, len(messages), model)
+        
+        job = self._wait_for_batch(job, timeout)
+        state = getattr(job.state, "name", job.state)
+        if state != "JOB_STATE_SUCCEEDED":
+            raise Exception(f"Gemini batch job {job.name} ended in state {state}: {job.error}")
+        
+        results = []
+        for inlined_response in job.dest.inlined_responses:
+            if inlined_response.response is not None:
+                response = inlined_response.response
+                results.append({"content": self._get_text_extractor(response)(response), "error": None})
+            else:
+                results.append({"content": None, "error": inlined_response.error})
+        
+        logger.info("Gemini batch job %s completed with %d responses", job.name, len(results))
+        return results
+    
+    def _wait_for_batch(self, job: Any, timeout: float) -> Any:
+        """Poll a batch job with exponential backoff until it reaches a terminal state."""
+        get_batch = self.client.batches.get
+        deadline = time.monotonic() + timeout
+        interval = BATCH_POLL_INITIAL_INTERVAL
+        while getattr(job.state, "name", job.state) not in BATCH_TERMINAL_STATES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Gemini batch job {job.name} did not finish within {timeout:.0f}s")
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, BATCH_POLL_MAX_INTERVAL)
+            job = get_batch(name=job.name)
+        return job
@@ -1,18 +1,37 @@
 """Configuration settings for the application."""
 import os
+import re
 from pathlib import Path
-from dotenv import load_dotenv
 
 # Base directory
 BASE_DIR = Path(__file__).parent
 
 # Load environment variables from .env file
+# (skipped, along with the dotenv import, when settings come from the real environment only)
 env_path = BASE_DIR / ".env"
-load_dotenv(dotenv_path=env_path)
+if env_path.is_file():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=env_path)
 
 # Database
 DATABASE_PATH = BASE_DIR / "data" / "vector_infinity.db"
 
+# Database connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+# Ping connections on every checkout; a local SQLite file never drops connections, so this is
+# an extra query per session for nothing unless the database is moved to a network server
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+
+# SQLite tuning applied to every new connection. WAL lets readers run alongside the
+# importer's writes; NORMAL sync is durable in WAL mode except across a power loss
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))  # wait for locks instead of failing
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))  # page cache per connection
+
 # Plugins directory
 PLUGINS_DIR = BASE_DIR / "plugins"
 
@@ -31,6 +50,38 @@ DAILY_IMPORT_TIME = os.getenv("DAILY_IMPORT_TIME", "02:00")  # 2 AM
 # Gemini API Key (required)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 
+# HTTP connection pool of the shared Gemini client
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "100"))
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GEMINI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+GEMINI_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "30"))  # seconds an idle connection is kept open
+
+# Maximum number of Gemini generate_content calls in flight per process
+# Keeps bursts of chat traffic under the account's requests-per-minute limit
+CHAT_MAX_CONCURRENT = int(os.getenv("CHAT_MAX_CONCURRENT", "16"))
+
+# Retries for rate-limited (429) or failed (5xx) Gemini calls, with jittered exponential backoff
+CHAT_MAX_RETRIES = int(os.getenv("CHAT_MAX_RETRIES", "5"))
+
+# Client-side Gemini rate limits per process (requests and estimated input tokens per minute)
+# Set to your account's quota to pace bursts before they hit 429s; 0 disables the limit
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "0"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "0"))
+
+# Most recent history messages sent to Gemini with each chat turn (the full history is still stored)
+# Bounds prompt size and cost for long threads; 0 sends the whole history
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "40"))
+
+# Cache for first-turn chat responses (identical question, settings and store)
+# Set CHAT_RESPONSE_CACHE_TTL to 0 to disable
+CHAT_RESPONSE_CACHE_SIZE = int(os.getenv("CHAT_RESPONSE_CACHE_SIZE", "1024"))
+CHAT_RESPONSE_CACHE_TTL = int(os.getenv("CHAT_RESPONSE_CACHE_TTL", "600"))  # seconds
+
+# How long per-user chat settings (instructions, model) are cached in each worker
+SETTINGS_CACHE_TTL = int(os.getenv("SETTINGS_CACHE_TTL", "60"))  # seconds
+
+# How long File Search Store details (document counts) are reused by the per-chat store check
+STORE_INFO_CACHE_TTL = int(os.getenv("STORE_INFO_CACHE_TTL", "60"))  # seconds
+
 # Secret key for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "change-this-secret-key-in-production")
 
@@ -52,69 +103,32 @@ AVAILABLE_MODELS_STR = os.getenv(
 )
 
 # Parse available models into a list of model names and a dict of display names
-# Handle commas in display names by identifying model entries by their prefixes
+# Handle commas in display names by only splitting at commas followed by a model name prefix
+# (model entries start with patterns like "gemini-", "gpt-", "o1-", "claude-", etc.)
+MODEL_ENTRY_SEPARATOR = re.compile(r"\s*,\s*(?=(?:gemini-|gpt-|o1-|claude-|llama-|mistral-|anthropic-))")
+
 AVAILABLE_MODELS = []
 MODEL_DISPLAY_NAMES = {}
 DEFAULT_MODEL = "gemini-3-pro-preview"
 
-if AVAILABLE_MODELS_STR:
-    # Split by comma, then reconstruct entries by grouping items
-    # Model entries typically start with patterns like "gemini-", "gpt-", "o1-", "claude-", etc.
-    parts = [p.strip() for p in AVAILABLE_MODELS_STR.split(",")]
-    
-    current_entry = None
-    for part in parts:
-        if not part:
-            continue
-            
-        # Check if this part starts a new model entry (starts with model name pattern)
-        # Common patterns: gemini-, gpt-, o1-, claude-, etc.
-        is_model_start = any(part.startswith(prefix) for prefix in [
-            "gemini-", "gpt-", "o1-", "claude-", "llama-", "mistral-", "anthropic-"
-        ]) or (":" in part and any(part.split(":")[0].strip().startswith(prefix) for prefix in [
-            "gemini-", "gpt-", "o1-", "claude-", "llama-", "mistral-", "anthropic-"
-        ]))
-        
-        if is_model_start:
-            # Save previous entry if exists
-            if current_entry:
-                if ":" in current_entry:
-                    model_name, display_name = current_entry.split(":", 1)
-                    model_name = model_name.strip()
-                    display_name = display_name.strip()
-                    AVAILABLE_MODELS.append(model_name)
-                    MODEL_DISPLAY_NAMES[model_name] = display_name
-                else:
-                    AVAILABLE_MODELS.append(current_entry)
-                    MODEL_DISPLAY_NAMES[current_entry] = current_entry
-            
-            # Start new entry
-            current_entry = part
-        else:
-            # This is a continuation of the previous entry (part of display name)
-            if current_entry:
-                current_entry += ", " + part
-            else:
-                # No current entry, treat as standalone (shouldn't happen but handle gracefully)
-                current_entry = part
-    
-    # Don't forget the last entry
-    if current_entry:
-        if ":" in current_entry:
-            model_name, display_name = current_entry.split(":", 1)
-            model_name = model_name.strip()
-            display_name = display_name.strip()
-            AVAILABLE_MODELS.append(model_name)
-            MODEL_DISPLAY_NAMES[model_name] = display_name
-        else:
-            AVAILABLE_MODELS.append(current_entry)
-            MODEL_DISPLAY_NAMES[current_entry] = current_entry
+for entry in MODEL_ENTRY_SEPARATOR.split(AVAILABLE_MODELS_STR):
+    entry = entry.strip(" ,")
+    if not entry:
+        continue
+    # If no display name is provided, the model name is used
+    model_name, _, display_name = entry.partition(":")
+    model_name = model_name.strip()
+    AVAILABLE_MODELS.append(model_name)
+    MODEL_DISPLAY_NAMES[model_name] = display_name.strip() or model_name
 
 # Ensure default model is in the list
 if DEFAULT_MODEL not in AVAILABLE_MODELS:
     AVAILABLE_MODELS.insert(0, DEFAULT_MODEL)
     MODEL_DISPLAY_NAMES[DEFAULT_MODEL] = DEFAULT_MODEL
 
+# Set view of the available models for membership checks (the list keeps display order)
+AVAILABLE_MODELS_SET = frozenset(AVAILABLE_MODELS)
+
 # Create necessary directories
 DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
 LOGS_DIR.mkdir(parents=True, exist_ok=True)
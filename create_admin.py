@@ -20,7 +20,6 @@ sys.path.insert(0, SCRIPT_DIR)
 try:
     from werkzeug.security import generate_password_hash
     from database import User, SessionLocal, init_db
-    from datetime import datetime, timezone
 except ImportError as e:
     print(f"Error: Missing required dependencies. Please activate the virtual environment first:")
     print(f"  source venv/bin/activate")
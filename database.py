@@ -1,6 +1,7 @@
 """Database models and connection."""
 from datetime import datetime, timezone
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, LargeBinary, ForeignKey, UniqueConstraint
+from sqlalchemy import create_engine, event, Column, Integer, String, Text, DateTime, JSON, LargeBinary, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from flask_login import UserMixin
@@ -9,6 +10,11 @@ import config
 Base = declarative_base()
 
 
+def _utcnow() -> datetime:
+    """Current UTC time; the default for timestamp columns."""
+    return datetime.now(timezone.utc)
+
+
 class User(UserMixin, Base):
     """User model for authentication."""
     __tablename__ = "users"
@@ -18,8 +24,8 @@ class User(UserMixin, Base):
     password_hash = Column(String(255), nullable=False)
     role = Column(String(20), nullable=False, default="regular")  # admin or regular
     active = Column(Integer, nullable=False, default=0)  # 0 = inactive, 1 = active (for approval)
-    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, nullable=False, default=_utcnow)
+    updated_at = Column(DateTime, nullable=False, default=_utcnow, onupdate=_utcnow)
     
     def is_active(self):
         """Check if user account is active (approved)."""
@@ -38,7 +44,7 @@ class ImportLog(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     plugin_name = Column(String(100), nullable=False, index=True)
     status = Column(String(20), nullable=False)  # success, error, running
-    started_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    started_at = Column(DateTime, nullable=False, default=_utcnow)
     completed_at = Column(DateTime, nullable=True)
     records_imported = Column(Integer, default=0)
     error_message = Column(Text, nullable=True)
@@ -60,13 +66,16 @@ class DataItem(Base):
     title = Column(String(500), nullable=True)
     content = Column(Text, nullable=True)
     item_metadata = Column(JSON, nullable=True)  # Additional structured data (renamed from 'metadata' to avoid SQLAlchemy conflict)
-    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, nullable=False, default=_utcnow)
+    updated_at = Column(DateTime, nullable=False, default=_utcnow, onupdate=_utcnow)
     source_timestamp = Column(DateTime, nullable=True)  # Original timestamp from source
     embedding = Column(LargeBinary, nullable=True)  # Deprecated: kept for backward compatibility (no longer used)
     
-    # Unique constraint on user_id + plugin_name + source_id
+    # Unique index on user_id + plugin_name + source_id (the importer's existing-item lookup),
+    # plus one for per-plugin queries filtered by item type
     __table_args__ = (
+        Index('uq_data_items_user_plugin_source', 'user_id', 'plugin_name', 'source_id', unique=True),
+        Index('ix_data_items_user_plugin_type', 'user_id', 'plugin_name', 'item_type'),
         {'sqlite_autoincrement': True},
     )
 
@@ -82,8 +91,8 @@ class ChatThread(Base):
     previous_response_id = Column(String(255), nullable=True, index=True)  # Previous response ID (legacy, for backward compatibility)
     conversation_history = Column(JSON, nullable=True)  # Store conversation messages locally (for backward compatibility)
     title = Column(String(500), nullable=True)  # Optional title (first message or user-defined)
-    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, nullable=False, default=_utcnow)
+    updated_at = Column(DateTime, nullable=False, default=_utcnow, onupdate=_utcnow)
 
 
 class UserSettings(Base):
@@ -95,8 +104,8 @@ class UserSettings(Base):
     assistant_instructions = Column(Text, nullable=True)  # Custom AI assistant instructions
     assistant_model = Column(String(50), nullable=True)  # Model preference (e.g., "gemini-3-pro-preview")
     assistant_id = Column(String(255), nullable=True)  # Assistant ID (kept for backward compatibility, not used with Gemini)
-    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, nullable=False, default=_utcnow)
+    updated_at = Column(DateTime, nullable=False, default=_utcnow, onupdate=_utcnow)
 
 
 class PluginConfiguration(Base):
@@ -107,8 +116,8 @@ class PluginConfiguration(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     plugin_name = Column(String(100), nullable=False, index=True)
     config_data = Column(JSON, nullable=False)  # JSON object with plugin-specific configuration
-    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, nullable=False, default=_utcnow)
+    updated_at = Column(DateTime, nullable=False, default=_utcnow, onupdate=_utcnow)
     
     # Unique constraint on user_id + plugin_name
     __table_args__ = (
@@ -118,7 +127,35 @@ class PluginConfiguration(Base):
 
 
 # Database engine and session
-engine = create_engine(f"sqlite:///{config.DATABASE_PATH}", echo=False, pool_pre_ping=True)
+# Pool is sized so bursts of concurrent requests don't serialize on connection checkout.
+# All database access goes through this engine (via SessionLocal); don't create per-call engines.
+engine = create_engine(
+    f"sqlite:///{config.DATABASE_PATH}",
+    echo=False,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    # Pooled connections are handed to whichever request thread checks them out next
+    connect_args={"check_same_thread": False}
+)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply SQLite tuning once per new pooled connection (pooled connections keep it)."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -127,6 +164,25 @@ def init_db():
     Base.metadata.create_all(bind=engine)
 
 
+def bulk_insert_data_items(db, rows: list):
+    """Insert many data_items rows in one executemany, bypassing per-object ORM bookkeeping.
+    
+    Rows are dicts keyed by DataItem column name; the caller commits. Rows whose
+    (user_id, plugin_name, source_id) already exists are skipped, so an item stored by a
+    concurrent import of the same plugin doesn't fail the whole batch.
+    """
+    if rows:
+        # One timestamp for the whole batch instead of a default call per row per column
+        now = _utcnow()
+        for row in rows:
+            row.setdefault("created_at", now)
+            row.setdefault("updated_at", now)
+        insert_stmt = sqlite_insert(DataItem.__table__).on_conflict_do_nothing(
+            index_elements=["user_id", "plugin_name", "source_id"]
+        )
+        db.execute(insert_stmt, rows)
+
+
 def get_db():
     """Get database session."""
     db = SessionLocal()
@@ -7,36 +7,86 @@ from google.genai import types
 import tempfile
 import json
 import time
+import threading
+from utils.cache import TTLCache
+from utils.genai_client import get_genai_client
+import config
 
 logger = logging.getLogger(__name__)
 
+# Unified store names by user, shared by every FileSearchService instance in the process.
+# Stores are never deleted by the app, so a resolved name stays valid.
+_store_names: Dict[Optional[int], str] = {}
+
+# One lookup lock per user, so a slow list/create call for one user doesn't block the others
+# (the global lock only guards the dict of locks and is never held across a network call)
+_store_lookup_locks: Dict[Optional[int], threading.Lock] = {}
+_store_lookup_locks_lock = threading.Lock()
+
+
+def _store_lookup_lock(user_id: Optional[int]) -> threading.Lock:
+    with _store_lookup_locks_lock:
+        lock = _store_lookup_locks.get(user_id)
+        if lock is None:
+            lock = _store_lookup_locks[user_id] = threading.Lock()
+        return lock
+
+# Store details by store name for callers that can tolerate slightly stale counts
+# (dropped whenever the app uploads into that store)
+_store_info_cache = TTLCache(maxsize=1024, ttl=config.STORE_INFO_CACHE_TTL)
+
+# Upload count per store, bumped on every upload so caches of answers grounded in a store can
+# tell its contents changed (per process; other workers rely on their cache TTLs)
+_store_generations: Dict[str, int] = {}
+_store_generations_lock = threading.Lock()
+
+
+def get_store_generation(store_name: Optional[str]) -> int:
+    """Return how many uploads this process has made into a store (0 if none)."""
+    return _store_generations.get(store_name, 0)
+
+
+def _bump_store_generation(store_name: str) -> None:
+    with _store_generations_lock:
+        _store_generations[store_name] = _store_generations.get(store_name, 0) + 1
+
+
+# Item types formatted as WHOOP records when uploading
+WHOOP_ITEM_TYPES = frozenset({"whoop_recovery", "whoop_sleep", "whoop_workout"})
+
 
 class FileSearchService:
     """Service for managing File Search Stores - unified store for all plugins."""
     
-    def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable is required")
-        self.client = genai.Client(api_key=api_key)
-        self._unified_store_id = None  # Cache unified store ID
+    def __init__(self, client: Optional[genai.Client] = None):
+        # Reuse the caller's client, or the process-wide one, so connections are pooled
+        self.client = client if client is not None else get_genai_client()
     
     def get_or_create_unified_file_search_store(self, user_id: int = None) -> Optional[str]:
         """Get or create a unified file search store for all plugins (user-specific)."""
-        # Use user-specific cache key
-        cache_key = f"user_{user_id}" if user_id else "default"
-        if hasattr(self, f'_unified_store_id_{cache_key}'):
-            return getattr(self, f'_unified_store_id_{cache_key}')
+        cached_name = _store_names.get(user_id)
+        if cached_name:
+            return cached_name
         
+        # Serialize a user's lookups so their concurrent first requests don't each list (or create) the store
+        with _store_lookup_lock(user_id):
+            cached_name = _store_names.get(user_id)
+            if cached_name:
+                return cached_name
+            store_name = self._find_or_create_unified_store(user_id)
+            if store_name:
+                _store_names[user_id] = store_name
+            return store_name
+    
+    def _find_or_create_unified_store(self, user_id: Optional[int]) -> Optional[str]:
         store_name = f"vector_infinity_unified_user_{user_id}" if user_id else "vector_infinity_unified"
         
         # Try to find existing unified file search store
         try:
             stores = self.client.file_search_stores.list()
             for store in stores:
-                if hasattr(store, 'display_name') and store.display_name == store_name:
+                if store.display_name == store_name:
                     logger.info(f"Found existing unified file search store for user {user_id}: {store.name}")
-                    setattr(self, f'_unified_store_id_{cache_key}', store.name)
                     return store.name
         except Exception as e:
             logger.warning(f"Error listing file search stores: {e}")
@@ -48,7 +98,6 @@ class FileSearchService:
                 config={'display_name': store_name}
             )
             logger.info(f"Created new unified file search store for user {user_id}: {store.name}")
-            setattr(self, f'_unified_store_id_{cache_key}', store.name)
             return store.name
         except Exception as e:
             logger.error(f"Error creating unified file search store: {e}")
@@ -97,22 +146,17 @@ class FileSearchService:
                 doc_parts = []
                 doc_parts.append(f"Source: {plugin_name}")
                 
+                # Type-specific header lines; every type then ends with the date and content
+                date_format = '%Y-%m-%d %H:%M:%S'
                 if item_type == "whatsapp_message":
                     doc_parts.append("Type: WhatsApp Message")
                     if metadata.get("sender"):
                         doc_parts.append(f"From: {metadata['sender']}")
-                    if source_timestamp:
-                        doc_parts.append(f"Date: {source_timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
-                    if content:
-                        doc_parts.append(content)
-                elif item_type in ["whoop_recovery", "whoop_sleep", "whoop_workout"]:
+                elif item_type in WHOOP_ITEM_TYPES:
                     doc_parts.append(f"Type: WHOOP {item_type.replace('whoop_', '').title()}")
                     if title:
                         doc_parts.append(title)
-                    if source_timestamp:
-                        doc_parts.append(f"Date: {source_timestamp.strftime('%Y-%m-%d')}")
-                    if content:
-                        doc_parts.append(content)
+                    date_format = '%Y-%m-%d'
                 elif item_type == "github_file":
                     doc_parts.append("Type: GitHub File")
                     if title:
@@ -123,20 +167,17 @@ class FileSearchService:
                         doc_parts.append(f"Repository: {metadata['repo']}")
                     if metadata.get("path"):
                         doc_parts.append(f"Path: {metadata['path']}")
-                    if source_timestamp:
-                        doc_parts.append(f"Date: {source_timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
-                    if content:
-                        doc_parts.append(content)
                 else:  # email and other types
                     doc_parts.append("Type: Email")
                     if title:
                         doc_parts.append(f"Subject: {title}")
                     if metadata.get("from"):
                         doc_parts.append(f"From: {metadata['from']}")
-                    if source_timestamp:
-                        doc_parts.append(f"Date: {source_timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
-                    if content:
-                        doc_parts.append(content)
+                
+                if source_timestamp:
+                    doc_parts.append(f"Date: {source_timestamp.strftime(date_format)}")
+                if content:
+                    doc_parts.append(content)
                 
                 formatted_items.append("\n".join(doc_parts))
             
@@ -146,115 +187,108 @@ class FileSearchService:
                 temp_file_path = f.name
             
             try:
-                # Upload file to Files API
-                with open(temp_file_path, 'rb') as file:
-                    uploaded_file = self.client.files.upload(
-                        file=file,
-                        config={'display_name': f"{plugin_name}_batch_{int(time.time())}"}
-                    )
-                
-                logger.info(f"Uploaded file {uploaded_file.name} for {plugin_name} to Files API")
-                
-                # Import file into file search store
-                import_op = self.client.file_search_stores.import_file(
+                # Upload the file straight into the file search store (one call instead of
+                # a Files API upload followed by a separate import)
+                import_op = self.client.file_search_stores.upload_to_file_search_store(
+                    file=temp_file_path,
                     file_search_store_name=store_name,
-                    file_name=uploaded_file.name
+                    config={
+                        'display_name': f"{plugin_name}_batch_{int(time.time())}",
+                        'mime_type': 'text/plain'
+                    }
                 )
-                
-                logger.info(f"Imported file {uploaded_file.name} into file search store {store_name}")
-                
-                # Optionally wait for processing
-                if wait_for_processing:
-                    max_wait = 120  # 2 minutes
-                    wait_time = 0
-                    while wait_time < max_wait:
-                        # Check operation status
-                        try:
-                            op = self.client.operations.get(name=import_op.name)
-                            if op.done:
-                                if hasattr(op, 'error') and op.error:
-                                    logger.error(f"File search store import failed: {op.error}")
-                                    return False
-                                logger.info(f"File search store import completed for {plugin_name}")
-                                return True
-                        except Exception as e:
-                            logger.warning(f"Error checking operation status: {e}")
-                        
-                        time.sleep(2)
-                        wait_time += 2
-                    
-                    logger.warning(f"File search store import timeout for {plugin_name} (still processing)")
-                
-                # File is imported and will be processed in the background
-                return True
-                
             finally:
-                # Clean up temp file
+                # Document counts (and answers grounded in this store) are about to change
+                _store_info_cache.pop(store_name)
+                _bump_store_generation(store_name)
+                # Clean up temp file as soon as it has been sent, not after waiting for processing
                 try:
                     os.unlink(temp_file_path)
-                except:
-                    pass
+                except OSError as e:
+                    logger.debug(f"Could not remove temp file {temp_file_path}: {e}")
+            
+            logger.info(f"Uploaded {len(data_items)} {plugin_name} items into file search store {store_name}")
+            
+            # Optionally wait for processing
+            if wait_for_processing:
+                op = self._wait_for_operation(import_op, timeout=120)
+                if op is None:
+                    logger.warning(f"File search store import timeout for {plugin_name} (still processing)")
+                elif op.error:
+                    logger.error(f"File search store import failed: {op.error}")
+                    return False
+                else:
+                    logger.info(f"File search store import completed for {plugin_name}")
+                    return True
+            
+            # File is imported and will be processed in the background
+            return True
                     
         except Exception as e:
             logger.error(f"Error uploading data to file search store for {plugin_name}: {e}", exc_info=True)
             return False
     
+    def _wait_for_operation(
+        self, operation: Any, timeout: float, initial_interval: float = 0.5, max_interval: float = 5
+    ) -> Optional[Any]:
+        """Poll a long-running operation until it is done.
+        
+        Polls quickly at first (small imports finish in a few seconds) and backs off exponentially
+        up to max_interval so long imports do not hammer the API.
+        Returns the finished operation (check its `error`), or None if it is still running after timeout seconds.
+        """
+        get_operation = self.client.operations.get  # Resolved once, not per poll
+        deadline = time.monotonic() + timeout
+        interval = initial_interval
+        while True:
+            if operation.done:
+                return operation
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 1.5, max_interval)
+            try:
+                # The SDK refreshes an operation from the operation object itself
+                operation = get_operation(operation)
+            except Exception as e:
+                logger.warning(f"Error checking operation status: {e}")
+    
     def get_unified_file_search_store_name(self, user_id: int = None) -> Optional[str]:
         """Get the unified file search store name (cached, user-specific)."""
-        cache_key = f"user_{user_id}" if user_id else "default"
-        cached_name = getattr(self, f'_unified_store_id_{cache_key}', None)
-        return cached_name or self.get_or_create_unified_file_search_store(user_id=user_id)
+        return _store_names.get(user_id) or self.get_or_create_unified_file_search_store(user_id=user_id)
     
-    def get_file_search_store_info(self, user_id: int = None) -> Optional[Dict[str, Any]]:
-        """Get information about the unified file search store."""
+    def get_file_search_store_info(self, user_id: int = None, use_cache: bool = False) -> Optional[Dict[str, Any]]:
+        """Get information about the unified file search store.
+        
+        With use_cache, recently fetched details are reused instead of calling the API again.
+        """
         store_name = self.get_unified_file_search_store_name(user_id=user_id)
         if not store_name:
             return None
         
+        if use_cache:
+            cached_info = _store_info_cache.get(store_name)
+            if cached_info is not None:
+                return cached_info
+        
         try:
-            # Get store details
+            # Get store details; the store reports its own document counts, so no file listing is needed
             store = self.client.file_search_stores.get(name=store_name)
             
-            # List files in the store
-            # Note: The API structure might be different - try multiple approaches
-            file_count = 0
-            try:
-                # Try the correct API structure for listing files in a File Search Store
-                # Files are managed through the Files API and associated with stores
-                # We'll try to get file count through the store's file associations
-                try:
-                    # Method 1: Try direct files listing if available
-                    if hasattr(self.client, 'file_search_stores') and hasattr(self.client.file_search_stores, 'files'):
-                        files_response = self.client.file_search_stores.files.list(parent=store_name, page_size=100)
-                        if hasattr(files_response, 'file_search_store_files'):
-                            file_count = len(list(files_response.file_search_store_files))
-                except AttributeError:
-                    # Method 2: Try listing all files and checking which are in this store
-                    # This is a workaround - we can't directly list files in a store
-                    # So we'll return None for file_count and let the user check via re-upload
-                    logger.info("Cannot directly list files in File Search Store - file count unavailable")
-                    file_count = None
-                except Exception as e:
-                    logger.warning(f"Could not list files in store: {e}")
-                    file_count = None
-                
-                if file_count is not None:
-                    logger.info(f"File Search Store {store_name} has {file_count} files")
-            except Exception as e:
-                logger.warning(f"Could not list files in store: {e}")
-                file_count = None
+            # Counts are omitted by the API when zero
+            file_count = store.active_documents_count or 0
+            logger.debug("File Search Store %s has %s files", store_name, file_count)
             
             result = {
                 "name": store.name,
-                "display_name": getattr(store, 'display_name', 'Unknown'),
-                "status": "active"
+                "display_name": store.display_name or 'Unknown',
+                "status": "active",
+                "file_count": file_count,
+                "pending_count": store.pending_documents_count or 0,
+                "failed_count": store.failed_documents_count or 0
             }
-            
-            if file_count is not None:
-                result["file_count"] = file_count
-            else:
-                result["file_count"] = "unknown"
-                result["note"] = "File count unavailable - check if files were uploaded during import"
+            _store_info_cache.set(store_name, result)
             
             return result
         except Exception as e:
@@ -2,15 +2,56 @@
 from datetime import datetime, timezone
 from typing import Optional
 from sqlalchemy.orm import Session
-from database import ImportLog, DataItem, SessionLocal, PluginConfiguration
+from database import ImportLog, DataItem, SessionLocal, PluginConfiguration, bulk_insert_data_items
 from plugin_loader import PluginLoader
+from file_search_service import FileSearchService
+import config
+import importlib.util
 import logging
+import sys
 import threading
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Source IDs per IN (...) query, well under SQLite's bound-parameter limit
+EXISTING_LOOKUP_CHUNK_SIZE = 500
+
+
+def _existing_items_by_source_id(db: Session, user_id: int, plugin_name: str, data_items: list) -> dict:
+    """Load the already-imported DataItems for a fetched batch, keyed by source_id.
+    
+    Replaces one SELECT per fetched item with one SELECT per EXISTING_LOOKUP_CHUNK_SIZE items.
+    """
+    source_ids = list({item.get("source_id") for item in data_items if item.get("source_id") is not None})
+    existing = {}
+    for start in range(0, len(source_ids), EXISTING_LOOKUP_CHUNK_SIZE):
+        chunk = source_ids[start:start + EXISTING_LOOKUP_CHUNK_SIZE]
+        rows = db.query(DataItem).filter(
+            DataItem.user_id == user_id,
+            DataItem.plugin_name == plugin_name,
+            DataItem.source_id.in_(chunk)
+        ).all()
+        for row in rows:
+            existing[row.source_id] = row
+    return existing
+
+
+def _data_item_row(user_id: int, plugin_name: str, item_data: dict) -> dict:
+    """Build a data_items row for bulk_insert_data_items from a plugin's fetched item."""
+    return {
+        "user_id": user_id,
+        "plugin_name": plugin_name,
+        "source_id": item_data.get("source_id"),
+        "item_type": item_data.get("item_type", "unknown"),
+        "title": item_data.get("title"),
+        "content": item_data.get("content"),
+        "item_metadata": item_data.get("metadata", {}),
+        "source_timestamp": item_data.get("source_timestamp")
+    }
+
+
 class ImportLogResult:
     """Simple result object to avoid SQLAlchemy DetachedInstanceError."""
     def __init__(self, data):
@@ -105,6 +146,8 @@ class DataImporter:
             
             records_imported = 0
             items_to_upload = []  # Collect items for file search store upload
+            existing_items = _existing_items_by_source_id(db, user_id, plugin_name, data_items)
+            new_rows = {}  # source_id -> row for items not yet in the database
             
             for idx, item_data in enumerate(data_items):
                 # Update progress every 10 items or on last item
@@ -113,38 +156,24 @@ class DataImporter:
                     log_entry.progress_message = f"Processing item {idx + 1} of {total_items}..."
                     db.commit()
                 # Check if item already exists (user-specific)
-                existing = db.query(DataItem).filter_by(
-                    user_id=user_id,
-                    plugin_name=plugin_name,
-                    source_id=item_data.get("source_id")
-                ).first()
+                source_id = item_data.get("source_id")
                 
-                if existing:
-                    # Skip existing items - only import new ones
+                if source_id in existing_items or source_id in new_rows:
+                    # Skip existing items (and later duplicates in this fetch) - only import new ones
                     continue
                 else:
-                    # Create new item
-                    new_item = DataItem(
-                        user_id=user_id,
-                        plugin_name=plugin_name,
-                        source_id=item_data.get("source_id"),
-                        item_type=item_data.get("item_type", "unknown"),
-                        title=item_data.get("title"),
-                        content=item_data.get("content"),
-                        item_metadata=item_data.get("metadata", {}),
-                        source_timestamp=item_data.get("source_timestamp")
-                    )
-                    db.add(new_item)
+                    # Queue new item for the bulk insert
+                    new_rows[source_id] = _data_item_row(user_id, plugin_name, item_data)
                     records_imported += 1
                     # Collect items for vector store upload
                     items_to_upload.append(item_data)
             
+            bulk_insert_data_items(db, list(new_rows.values()))
             db.commit()
             
             # Upload new items to Gemini File Search Store
             if items_to_upload:
                 try:
-                    from file_search_service import FileSearchService
                     file_search_service = FileSearchService()
                     
                     log_entry.progress_message = f"Uploading {len(items_to_upload)} items to File Search Store..."
@@ -196,6 +225,8 @@ class DataImporter:
             
         except Exception as e:
             logger.error(f"Error importing from {plugin_name}: {e}", exc_info=True)
+            # Discard the failed transaction (e.g. a rejected insert) so the error status can be written
+            db.rollback()
             log_entry.status = "error"
             log_entry.completed_at = datetime.now(timezone.utc)
             log_entry.error_message = str(e)
@@ -294,11 +325,6 @@ class DataImporter:
                 if not plugin:
                     # Try to load the plugin directly
                     try:
-                        import importlib.util
-                        import sys
-                        from pathlib import Path
-                        import config
-                        
                         plugin_dir = config.PLUGINS_DIR / plugin_name
                         plugin_file = plugin_dir / "plugin.py"
                         
@@ -399,6 +425,8 @@ class DataImporter:
                     
                     records_imported = 0
                     items_to_upload = []
+                    existing_items = _existing_items_by_source_id(db, user_id, plugin_name, data_items)
+                    new_rows = {}  # source_id -> row for items not yet in the database
                     
                     for idx, item_data in enumerate(data_items):
                         if idx % 10 == 0 or idx == len(data_items) - 1:
@@ -407,11 +435,10 @@ class DataImporter:
                             db.commit()
                         
                         source_id = item_data.get("source_id")
-                        existing = db.query(DataItem).filter_by(
-                            user_id=user_id,
-                            plugin_name=plugin_name,
-                            source_id=source_id
-                        ).first()
+                        if source_id in new_rows:
+                            # Later duplicate of an item already queued from this fetch
+                            continue
+                        existing = existing_items.get(source_id)
                         
                         if existing:
                             # Check if plugin wants to update existing item
@@ -429,27 +456,19 @@ class DataImporter:
                                 records_imported += 1
                                 # Re-upload to vector store since content changed
                                 items_to_upload.append(item_data)
-                                logger.debug(f"Updated existing item: {source_id} (ID: {existing.id})")
+                                logger.debug("Updated existing item: %s (ID: %s)", source_id, existing.id)
                             else:
                                 # Skip existing items that haven't changed
-                                logger.debug(f"Skipping unchanged item: {source_id} (already in database, ID: {existing.id})")
+                                logger.debug("Skipping unchanged item: %s (already in database, ID: %s)", source_id, existing.id)
                                 continue
                         else:
-                            new_item = DataItem(
-                                user_id=user_id,
-                                plugin_name=plugin_name,
-                                source_id=item_data.get("source_id"),
-                                item_type=item_data.get("item_type", "unknown"),
-                                title=item_data.get("title"),
-                                content=item_data.get("content"),
-                                item_metadata=item_data.get("metadata", {}),
-                                source_timestamp=item_data.get("source_timestamp")
-                            )
-                            db.add(new_item)
+                            # Queue new item for the bulk insert
+                            new_rows[source_id] = _data_item_row(user_id, plugin_name, item_data)
                             records_imported += 1
                             # Collect items for vector store upload
                             items_to_upload.append(item_data)
                     
+                    bulk_insert_data_items(db, list(new_rows.values()))
                     db.commit()
                     
                     skipped_count = total_items - records_imported
@@ -460,7 +479,6 @@ class DataImporter:
                     # Upload new items to Gemini File Search Store
                     if items_to_upload:
                         try:
-                            from file_search_service import FileSearchService
                             file_search_service = FileSearchService()
                             
                             logger.info(f"Preparing to upload {len(items_to_upload)} items to File Search Store for {plugin_name} (user {user_id})")
@@ -515,6 +533,8 @@ class DataImporter:
                     
                 except Exception as e:
                     logger.error(f"Error importing from {plugin_name}: {e}", exc_info=True)
+                    # Discard the failed transaction (e.g. a rejected insert) so the error status can be written
+                    db.rollback()
                     log_entry.status = "error"
                     log_entry.completed_at = datetime.now(timezone.utc)
                     log_entry.error_message = str(e)
@@ -1,7 +1,8 @@
 """Authentication routes."""
-from flask import Blueprint, request, jsonify, render_template_string, redirect, url_for
+from flask import Blueprint, request, jsonify, render_template_string, redirect, url_for, session
 from flask_login import login_user, logout_user, login_required, current_user
 import logging
+import traceback
 from database import User, SessionLocal
 from werkzeug.security import generate_password_hash, check_password_hash
 import re
@@ -121,7 +122,6 @@ def login():
             # Log in the user
             remember = data.get('remember', False)
             try:
-                from flask import session
                 login_user(user, remember=remember)
                 # Make session permanent to ensure cookie is set
                 session.permanent = True
@@ -141,7 +141,6 @@ def login():
             })
             
             # Ensure session cookie is set in response
-            from flask_login import current_user
             if current_user.is_authenticated:
                 logger.debug(f"Session cookie should be set for user {current_user.id}")
             
@@ -150,7 +149,6 @@ def login():
             db.close()
     except Exception as e:
         logger.error(f"Error logging in user: {e}", exc_info=True)
-        import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         # Return a more user-friendly error message
         error_msg = str(e)
@@ -1,8 +1,9 @@
 """Chat-related routes."""
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from flask_login import login_required, current_user
 import logging
-from chat_service import ChatService
+import uuid
+from services import get_chat_service
 from database import ChatThread, SessionLocal
 from datetime import datetime, timezone
 
@@ -10,6 +11,46 @@ logger = logging.getLogger(__name__)
 
 bp = Blueprint('chat', __name__, url_prefix='/api/chat')
 
+# Written to a chat stream that fails after it started, followed by the error message
+# (model output never contains NUL, so the client can split on it)
+STREAM_ERROR_MARKER = "\x00"
+
+
+def _apply_chat_result(chat_thread: ChatThread, message: str, result: dict):
+    """Update a chat thread with the result of sending a message."""
+    # Update thread with thread ID and conversation history
+    chat_thread.openai_thread_id = result["openai_thread_id"]  # Reusing field name for compatibility
+    chat_thread.conversation_history = result["messages"]
+    chat_thread.previous_response_id = result["response_id"]
+    chat_thread.updated_at = datetime.now(timezone.utc)
+    
+    # Update thread title from first message if not set
+    if not chat_thread.title or chat_thread.title.strip() == "":
+        # Use first 50 characters of message as title
+        title = message[:50].strip()
+        if len(message) > 50:
+            title += "..."
+        chat_thread.title = title
+        logger.info(f"Set thread title to: {title} for thread {chat_thread.thread_id}")
+
+
+def _save_streamed_result(thread_id: str, user_id: int, message: str, result: dict):
+    """Persist a streamed exchange (the request's session is closed by the time streaming ends)."""
+    db = SessionLocal()
+    try:
+        chat_thread = db.query(ChatThread).filter(
+            ChatThread.thread_id == thread_id,
+            ChatThread.user_id == user_id
+        ).first()
+        if chat_thread:
+            _apply_chat_result(chat_thread, message, result)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("Error saving streamed message: %s", e, exc_info=True)
+    finally:
+        db.close()
+
 
 @bp.route("/threads", methods=["GET"])
 @login_required
@@ -21,7 +62,7 @@ def list_chat_threads():
             ChatThread.user_id == current_user.id
         ).order_by(ChatThread.updated_at.desc()).all()
         
-        logger.info(f"Found {len(threads)} threads for user {current_user.id}")
+        logger.debug("Found %d threads for user %s", len(threads), current_user.id)
         
         result = []
         for thread in threads:
@@ -48,7 +89,6 @@ def create_chat_thread():
     db = SessionLocal()
     try:
         # Generate a unique thread ID for our internal tracking
-        import uuid
         thread_id = f"conv_{uuid.uuid4().hex[:16]}"
         
         # Thread ID will be set when first message is sent
@@ -102,36 +142,24 @@ def send_chat_message(thread_id):
         if not chat_thread:
             return jsonify({"error": "Thread not found or access denied"}), 404
         
-        chat_service = ChatService()
+        chat_service = get_chat_service()
         
         # Get thread ID (stored in openai_thread_id field for database compatibility)
         thread_id = chat_thread.openai_thread_id
         
-        # Send message and get response
+        # Send message and get response (the thread row is already loaded, so pass its history
+        # instead of having the service check out another session to read it again)
         result = chat_service.send_message(
             message=message,
             thread_id=thread_id,
-            user_id=current_user.id
+            user_id=current_user.id,
+            conversation_history=chat_thread.conversation_history or []
         )
         
         if result is None:
             return jsonify({"error": "Failed to get response from chat service"}), 500
         
-        # Update thread with thread ID and conversation history
-        chat_thread.openai_thread_id = result["openai_thread_id"]  # Reusing field name for compatibility
-        chat_thread.conversation_history = result["messages"]
-        chat_thread.previous_response_id = result["response_id"]
-        chat_thread.updated_at = datetime.now(timezone.utc)
-        
-        # Update thread title from first message if not set
-        if not chat_thread.title or chat_thread.title.strip() == "":
-            # Use first 50 characters of message as title
-            title = message[:50].strip()
-            if len(message) > 50:
-                title += "..."
-            chat_thread.title = title
-            logger.info(f"Set thread title to: {title} for thread {thread_id}")
-        
+        _apply_chat_result(chat_thread, message, result)
         db.commit()
         
         return jsonify({
@@ -141,12 +169,82 @@ def send_chat_message(thread_id):
         })
     except Exception as e:
         db.rollback()
-        logger.error(f"Error sending message: {e}", exc_info=True)
+        logger.error("Error sending message: %s", e, exc_info=True)
         return jsonify({"error": str(e)}), 500
     finally:
         db.close()
 
 
+@bp.route("/threads/<thread_id>/messages/stream", methods=["POST"])
+@login_required
+def stream_chat_message(thread_id):
+    """Send a message and stream the response text as it is generated (text/plain)."""
+    data = request.get_json() or {}
+    message = data.get("message", "")
+    
+    if not message:
+        return jsonify({"error": "message parameter is required"}), 400
+    
+    user_id = current_user.id
+    db = SessionLocal()
+    try:
+        # Verify thread belongs to user
+        chat_thread = db.query(ChatThread).filter(
+            ChatThread.thread_id == thread_id,
+            ChatThread.user_id == user_id
+        ).first()
+        
+        if not chat_thread:
+            return jsonify({"error": "Thread not found or access denied"}), 404
+        
+        # Thread ID (stored in openai_thread_id field for database compatibility)
+        service_thread_id = chat_thread.openai_thread_id
+        conversation_history = chat_thread.conversation_history or []
+    finally:
+        db.close()
+    
+    chat_service = get_chat_service()
+    chunks = chat_service.send_message_stream(
+        message=message,
+        thread_id=service_thread_id,
+        user_id=user_id,
+        conversation_history=conversation_history
+    )
+    
+    # Run the Gemini call up to its first chunk before any headers go out, so failures
+    # still come back as a JSON error with a proper status code
+    try:
+        first_chunk = next(chunks)
+    except StopIteration as stop:
+        # Empty answer: nothing to stream, but the exchange is still saved
+        _save_streamed_result(thread_id, user_id, message, stop.value)
+        return Response("", mimetype="text/plain")
+    except Exception as e:
+        logger.error("Error sending message: %s", e, exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    
+    def generate():
+        yield first_chunk
+        try:
+            result = yield from chunks
+        except Exception as e:
+            # Headers are already sent; report the failure in-band so the client drops the partial answer
+            logger.error("Error streaming message: %s", e, exc_info=True)
+            yield f"{STREAM_ERROR_MARKER}{e}"
+            return
+        
+        # Persist the completed exchange once the full response has been streamed
+        _save_streamed_result(thread_id, user_id, message, result)
+    
+    # Nginx buffers proxied responses by default, which would hold every chunk until the answer
+    # is complete; X-Accel-Buffering turns that off for this response only
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/plain",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+    )
+
+
 @bp.route("/threads/<thread_id>/messages", methods=["GET"])
 @login_required
 def get_chat_messages(thread_id):
@@ -163,16 +261,17 @@ def get_chat_messages(thread_id):
             return jsonify({"error": "Thread not found or access denied"}), 404
         
         # Use local conversation history (Gemini stores history in database)
-        conversation_history = chat_thread.conversation_history if chat_thread.conversation_history else []
+        created_at = chat_thread.updated_at.isoformat() if chat_thread.updated_at else None
         
         # Convert to the format expected by the frontend
-        messages = []
-        for msg in conversation_history:
-            messages.append({
+        messages = [
+            {
                 "role": msg.get("role"),
                 "content": msg.get("content"),
-                "created_at": chat_thread.updated_at.isoformat() if chat_thread.updated_at else None
-            })
+                "created_at": created_at
+            }
+            for msg in chat_thread.conversation_history or ()
+        ]
         
         return jsonify({"messages": messages})
     except Exception as e:
@@ -8,6 +8,7 @@ from pathlib import Path
 from datetime import datetime, timezone
 from database import ImportLog, DataItem, SessionLocal, engine, Base, UserSettings
 from file_search_service import FileSearchService
+from chat_service import DEFAULT_INSTRUCTIONS, invalidate_user_settings, clear_user_settings_cache
 import config
 
 logger = logging.getLogger(__name__)
@@ -161,6 +162,7 @@ def factory_reset():
             # Close any existing connections
             Base.metadata.drop_all(bind=engine)
             Base.metadata.create_all(bind=engine)
+            clear_user_settings_cache()
             logger.info("Recreated database schema")
         except Exception as e:
             error_msg = f"Error recreating database: {e}"
@@ -280,17 +282,15 @@ def reupload_all_data_to_file_search_store():
                 # Upload in batches (optimized - don't wait for processing on each batch)
                 batch_size = 500  # Batch size for File Search Store uploads
                 plugin_uploaded = 0
-                total_batches = (len(items) + batch_size - 1) // batch_size
                 
                 for batch_start in range(0, len(items), batch_size):
                     batch_end = min(batch_start + batch_size, len(items))
                     batch_items = items[batch_start:batch_end]
-                    batch_num = batch_start // batch_size + 1
                     
-                    # Only wait for processing on the last batch
-                    wait_for_processing = (batch_num == total_batches)
+                    # Don't hold the request worker while the store indexes the import;
+                    # processing continues server-side once the file is imported
                     success = file_search_service.upload_data_to_file_search_store(
-                        plugin_name, batch_items, user_id=current_user.id, wait_for_processing=wait_for_processing
+                        plugin_name, batch_items, user_id=current_user.id, wait_for_processing=False
                     )
                     if success:
                         plugin_uploaded += len(batch_items)
@@ -320,17 +320,14 @@ def get_assistant_instructions():
     """Get the current assistant instructions for the user."""
     db = SessionLocal()
     try:
-        settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
-        
-        default_instructions = "You are a helpful assistant that can answer questions using both your general knowledge and any relevant context from imported data (Gmail, WhatsApp, WHOOP, etc.). Answer questions naturally and directly. If you find relevant information in the imported data, mention the source when helpful. If the question is about general topics not covered in the imported data, answer using your general knowledge without mentioning that the information wasn't found in the files. Be concise and helpful."
-        
-        instructions = default_instructions
-        if settings and settings.assistant_instructions:
-            instructions = settings.assistant_instructions
+        custom_instructions = db.query(UserSettings.assistant_instructions).filter(
+            UserSettings.user_id == current_user.id
+        ).limit(1).scalar()
         
+        # Show the same default the chat service actually uses
         return jsonify({
-            "instructions": instructions,
-            "is_custom": settings is not None and settings.assistant_instructions is not None
+            "instructions": custom_instructions or DEFAULT_INSTRUCTIONS,
+            "is_custom": custom_instructions is not None
         })
     finally:
         db.close()
@@ -351,15 +348,21 @@ def update_assistant_instructions():
         # Get or create user settings
         settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
         
+        changed = True
         if not settings:
             settings = UserSettings(user_id=current_user.id, assistant_instructions=instructions)
             db.add(settings)
-        else:
+        elif settings.assistant_instructions != instructions:
             settings.assistant_instructions = instructions
             settings.updated_at = datetime.now(timezone.utc)
+        else:
+            changed = False
         
-        db.commit()
-        db.refresh(settings)
+        # Skip the write transaction (and keep cached settings) when nothing changed
+        if changed:
+            db.commit()
+            db.refresh(settings)
+            invalidate_user_settings(current_user.id)
         
         logger.info(f"Updated assistant instructions for user {current_user.id}")
         
@@ -387,7 +390,7 @@ def get_assistant_model():
         model = config.DEFAULT_MODEL
         if settings and settings.assistant_model:
             # Validate that the user's model is still available
-            if settings.assistant_model in config.AVAILABLE_MODELS:
+            if settings.assistant_model in config.AVAILABLE_MODELS_SET:
                 model = settings.assistant_model
             else:
                 # User's model is no longer available, use default
@@ -403,7 +406,7 @@ def get_assistant_model():
         
         return jsonify({
             "model": model,
-            "is_custom": settings is not None and settings.assistant_model is not None and settings.assistant_model in config.AVAILABLE_MODELS,
+            "is_custom": settings is not None and settings.assistant_model is not None and settings.assistant_model in config.AVAILABLE_MODELS_SET,
             "available_models": available_models,
             "default_model": config.DEFAULT_MODEL
         })
@@ -424,21 +427,27 @@ def update_assistant_model():
         if not model:
             return jsonify({"error": "Model cannot be empty"}), 400
         
-        if model not in config.AVAILABLE_MODELS:
+        if model not in config.AVAILABLE_MODELS_SET:
             return jsonify({"error": f"Invalid model. Must be one of: {', '.join(config.AVAILABLE_MODELS)}"}), 400
         
         # Get or create user settings
         settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
         
+        changed = True
         if not settings:
             settings = UserSettings(user_id=current_user.id, assistant_model=model)
             db.add(settings)
-        else:
+        elif settings.assistant_model != model:
             settings.assistant_model = model
             settings.updated_at = datetime.now(timezone.utc)
+        else:
+            changed = False
         
-        db.commit()
-        db.refresh(settings)
+        # Skip the write transaction (and keep cached settings) when nothing changed
+        if changed:
+            db.commit()
+            db.refresh(settings)
+            invalidate_user_settings(current_user.id)
         
         logger.info(f"Updated assistant model for user {current_user.id} to {model}")
         
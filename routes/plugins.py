@@ -7,6 +7,8 @@ import json
 import importlib.util
 import secrets
 import logging
+from sqlalchemy.exc import IntegrityError
+from google.oauth2.credentials import Credentials
 from database import ImportLog, SessionLocal, PluginConfiguration, DataItem
 import config
 from services import plugin_loader, oauth_flows
@@ -124,7 +126,6 @@ def list_plugins():
                     
                     if scopes:
                         try:
-                            from google.oauth2.credentials import Credentials
                             creds = Credentials.from_authorized_user_file(str(token_path), scopes)
                             if creds and creds.valid:
                                 auth_status = "authenticated"
@@ -303,24 +304,20 @@ def toggle_plugin(plugin_name):
         try:
             db.commit()
             db.refresh(plugin_config)
-        except Exception as commit_error:
+        except IntegrityError as commit_error:
             db.rollback()
-            # Check if it's a unique constraint violation
-            if "UNIQUE constraint failed" in str(commit_error) or "unique constraint" in str(commit_error).lower():
-                # Try to get the existing config and update it
-                plugin_config = db.query(PluginConfiguration).filter(
-                    PluginConfiguration.user_id == current_user.id,
-                    PluginConfiguration.plugin_name == plugin_name
-                ).first()
-                if plugin_config:
-                    current_config = plugin_config.config_data.copy() if plugin_config.config_data else {}
-                    current_config["enabled"] = enabled
-                    plugin_config.config_data = current_config
-                    plugin_config.updated_at = datetime.now(timezone.utc)
-                    db.commit()
-                    db.refresh(plugin_config)
-                else:
-                    raise commit_error
+            # Unique constraint violation: the row was created concurrently, so update it instead
+            plugin_config = db.query(PluginConfiguration).filter(
+                PluginConfiguration.user_id == current_user.id,
+                PluginConfiguration.plugin_name == plugin_name
+            ).first()
+            if plugin_config:
+                current_config = plugin_config.config_data.copy() if plugin_config.config_data else {}
+                current_config["enabled"] = enabled
+                plugin_config.config_data = current_config
+                plugin_config.updated_at = datetime.now(timezone.utc)
+                db.commit()
+                db.refresh(plugin_config)
             else:
                 raise commit_error
         
@@ -371,24 +368,20 @@ def update_plugin_config(plugin_name):
         try:
             db.commit()
             db.refresh(plugin_config)
-        except Exception as commit_error:
+        except IntegrityError as commit_error:
             db.rollback()
-            # Check if it's a unique constraint violation
-            if "UNIQUE constraint failed" in str(commit_error) or "unique constraint" in str(commit_error).lower():
-                # Try to get the existing config and update it
-                plugin_config = db.query(PluginConfiguration).filter(
-                    PluginConfiguration.user_id == current_user.id,
-                    PluginConfiguration.plugin_name == plugin_name
-                ).first()
-                if plugin_config:
-                    current_config = plugin_config.config_data.copy()
-                    current_config.update(data)
-                    plugin_config.config_data = current_config
-                    plugin_config.updated_at = datetime.now(timezone.utc)
-                    db.commit()
-                    db.refresh(plugin_config)
-                else:
-                    raise commit_error
+            # Unique constraint violation: the row was created concurrently, so update it instead
+            plugin_config = db.query(PluginConfiguration).filter(
+                PluginConfiguration.user_id == current_user.id,
+                PluginConfiguration.plugin_name == plugin_name
+            ).first()
+            if plugin_config:
+                current_config = plugin_config.config_data.copy()
+                current_config.update(data)
+                plugin_config.config_data = current_config
+                plugin_config.updated_at = datetime.now(timezone.utc)
+                db.commit()
+                db.refresh(plugin_config)
             else:
                 raise commit_error
         
@@ -1,8 +1,10 @@
 """Shared service instances for the application."""
 import logging
+import threading
 from importer import DataImporter
 from scheduler import ImportScheduler
 from plugin_loader import PluginLoader
+from chat_service import ChatService
 from utils.startup import clear_in_progress_imports
 from database import init_db
 
@@ -23,3 +25,25 @@ scheduler.start()
 # OAuth flows storage (in production, use Redis or similar)
 oauth_flows = {}
 
+
+# Chat service is created lazily (it requires GEMINI_API_KEY) and shared across requests
+# so concurrent chats reuse one Gemini client and its HTTP connection pool
+_chat_service = None
+_chat_service_lock = threading.Lock()
+
+
+def get_chat_service():
+    """Get the shared ChatService instance, creating it on first use."""
+    global _chat_service
+    if _chat_service is None:
+        with _chat_service_lock:
+            if _chat_service is None:
+                _chat_service = ChatService()
+    return _chat_service
+
+
+# Warm the chat service at startup so the first chat request doesn't pay for client setup
+try:
+    get_chat_service()
+except ValueError as e:
+    logger.warning("Chat service not initialized at startup: %s", e)
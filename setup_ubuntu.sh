@@ -185,6 +185,8 @@ else
 fi
 
 # Create systemd service file
+# Chat requests mostly wait on Gemini, so each gunicorn worker runs many threads (gthread)
+# to keep serving other requests meanwhile; CHAT_MAX_CONCURRENT still caps in-flight Gemini calls
 echo "Step 11: Creating systemd service..."
 SERVICE_FILE="/tmp/vector-infinity.service"
 cat > "$SERVICE_FILE" << EOF
@@ -197,7 +199,7 @@ Type=simple
 User=$USER
 WorkingDirectory=$SCRIPT_DIR
 Environment="PATH=$SCRIPT_DIR/venv/bin"
-ExecStart=$SCRIPT_DIR/venv/bin/gunicorn --bind 0.0.0.0:80 --workers 2 --threads 2 --timeout 120 app:app
+ExecStart=$SCRIPT_DIR/venv/bin/gunicorn --bind 0.0.0.0:80 --workers 2 --worker-class gthread --threads 16 --timeout 120 app:app
 Restart=always
 RestartSec=10
 
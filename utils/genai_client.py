@@ -0,0 +1,40 @@
+"""Process-wide Gemini client."""
+import os
+import functools
+import threading
+import httpx
+from google import genai
+from google.genai import types
+import config
+
+_client_lock = threading.Lock()
+
+
+def _http_options() -> types.HttpOptions:
+    """HTTP options with an explicitly sized connection pool for the shared client."""
+    limits = httpx.Limits(
+        max_connections=config.GEMINI_MAX_CONNECTIONS,
+        max_keepalive_connections=config.GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.GEMINI_KEEPALIVE_EXPIRY,
+    )
+    return types.HttpOptions(client_args={"limits": limits})
+
+
+@functools.lru_cache(maxsize=8)
+def _client_for_key(api_key: str) -> genai.Client:
+    return genai.Client(api_key=api_key, http_options=_http_options())
+
+
+def get_genai_client() -> genai.Client:
+    """Return the shared Gemini client for the configured API key, creating it on first use.
+
+    Every service goes through this one client so its HTTP connection pool (and the kept-alive
+    TLS connections in it) is reused across requests instead of being rebuilt per service instance.
+    Clients are cached per key, so a rotated GEMINI_API_KEY gets its own client.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY environment variable is required")
+    # lru_cache can run the factory twice under a race; the lock keeps it to one client per key
+    with _client_lock:
+        return _client_for_key(api_key)
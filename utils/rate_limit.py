@@ -0,0 +1,40 @@
+"""Client-side rate limiting utilities."""
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a per-minute rate.
+
+    The bucket holds at most one minute's worth of tokens. acquire() blocks until enough
+    tokens are available. A rate of 0 (or less) disables limiting.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.refill_per_second = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._condition = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def acquire(self, amount: float = 1) -> None:
+        """Block until `amount` tokens are available, then consume them."""
+        if not self.enabled:
+            return
+        # A request larger than the bucket could never be satisfied; let it through once full
+        amount = min(float(amount), self.capacity)
+        with self._condition:
+            self._refill()
+            while self._tokens < amount:
+                self._condition.wait((amount - self._tokens) / self.refill_per_second)
+                self._refill()
+            self._tokens -= amount
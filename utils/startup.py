@@ -12,22 +12,22 @@ def clear_in_progress_imports():
     try:
         # Check if user_id column exists (for backward compatibility)
         try:
-            # Try to query with user_id - if it fails, the column doesn't exist yet
-            # and we'll skip this step (schema update will handle it)
-            running_imports = db.query(ImportLog).filter(ImportLog.status == "running").all()
+            # One UPDATE instead of loading every running import and flushing each row;
+            # if the schema is outdated this fails and we skip the step (schema update will handle it)
+            cleared = db.query(ImportLog).filter(ImportLog.status == "running").update({
+                ImportLog.status: "error",
+                ImportLog.error_message: "Import interrupted by server restart",
+                ImportLog.completed_at: datetime.now(timezone.utc)
+            }, synchronize_session=False)
         except Exception as e:
             if "user_id" in str(e):
                 # Column doesn't exist yet, skip this step
                 logger.info("Skipping clear_in_progress_imports - database schema update needed")
                 return
             raise
-        if running_imports:
-            for log_entry in running_imports:
-                log_entry.status = "error"
-                log_entry.error_message = "Import interrupted by server restart"
-                log_entry.completed_at = datetime.now(timezone.utc)
-            db.commit()
-            logger.info(f"Marked {len(running_imports)} in-progress imports as error due to server restart")
+        db.commit()
+        if cleared:
+            logger.info(f"Marked {cleared} in-progress imports as error due to server restart")
     except Exception as e:
         logger.error(f"Error clearing in-progress imports on startup: {e}", exc_info=True)
         db.rollback()